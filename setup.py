@@ -1,9 +1,19 @@
 import sys
 import os
-from distutils.core import setup, Extension
+import subprocess
+import shutil
+import tempfile
+# Use setuptools when it is available; distutils is no longer included with
+# Python 3.12 and later.
+try:
+    from setuptools import setup, Extension
+    from setuptools.command.build_ext import build_ext
+except ImportError:
+    from distutils.core import setup, Extension
+    from distutils.command.build_ext import build_ext
 from distutils.command.clean import clean
-from distutils.command.build_ext import build_ext
-from distutils.sysconfig import get_python_inc, get_python_lib
+from distutils.errors import CompileError
+from distutils.spawn import find_executable
 
 def writeln(s):
     sys.stdout.write('%s\n' % s)
@@ -20,11 +30,14 @@ if sys.version[:3] < '2.6':
 # Initialize some global values.
 
 lib_path = 'lib'
+use_ccache = True
+use_lto = True
+use_pgo = False
+prefer_static = False
+use_native = False
 
-if sys.version.find('MSC') == -1:
-    windows = False
-else:
-    windows = True
+IS_WINDOWS = sys.platform.startswith('win')
+IS_MSVC = IS_WINDOWS and 'MSC' in sys.version
 
 # Several command line options can be used to modify compilation of GMPY2. 
 #
@@ -36,6 +49,19 @@ else:
 #                     and MPC shared libraries
 #  --static=<...>  -> create a statically linked library using libraries from
 #                     specified path
+#  --prefer-static -> with --shared=<...>, link GMP, MPFR, or MPC statically
+#                     if a static library is found next to its header
+#  --no-ccache     -> do not use ccache even if it is found on the PATH
+#  --ccache        -> use ccache if it is found on the PATH (the default)
+#  --no-lto        -> do not use link time optimization (LTO is only used
+#                     with unix compilers and MSVC; MSYS2/MinGW builds never
+#                     use it)
+#  --pgo           -> use profile guided optimization (gcc only); the test
+#                     suite is run against an instrumented build to collect
+#                     the profile
+#  --coverage      -> build for coverage analysis with gcov (gcc only)
+#  --native        -> optimize for the CPU of the build machine; the resulting
+#                     extension may not run on other machines
 #
 # Ugly hack ahead. Sorry.
 #
@@ -58,39 +84,117 @@ else:
 #  lib_path is set to 'lib64' or 'lib32' as appropriate.
 #
 #  --shared and --static are converted to -DSHARED and -DSTATIC.
+#
+#  --ccache and --no-ccache are removed from sys.argv and the global variable
+#  use_ccache is set to True or False as appropriate.
+#
+#  --no-lto is removed from sys.argv and the global variable use_lto is set to
+#  False.
+#
+#  --pgo is removed from sys.argv and the global variable use_pgo is set to
+#  True.
+#
+#  --prefer-static is removed from sys.argv and the global variable
+#  prefer_static is set to True.
+#
+#  --coverage is removed from sys.argv, the coverage options are appended to
+#  CFLAGS, and link time optimization is disabled.
+#
+#  --native is removed from sys.argv and the global variable use_native is set
+#  to True.
 
 defines = []
 
-for token in sys.argv[:]:
-    if token.lower() == '--force':
-        defines.append( ('FORCE', 1) )
-        sys.argv.remove(token)
-
-    if token.lower() == '--lib64':
-        lib_path = 'lib64'
-        sys.argv.remove(token)
+def set_global(name, value):
+    def handler(token):
+        globals()[name] = value
+    return handler
 
-    if token.lower() == '--lib32':
-        lib_path = 'lib32'
-        sys.argv.remove(token)
+def add_define(name):
+    def handler(token):
+        defines.append( (name, 1) )
+    return handler
 
-    if token.lower() == '--msys2':
-        defines.append( ('MSYS2', 1) )
-        sys.argv.remove(token)
-
-    if token.lower().startswith('--shared'):
+def add_dir_define(name):
+    # The directory following '=' is optional.
+    def handler(token):
         try:
-            defines.append( ('SHARED', token.split('=')[1]) )
+            defines.append( (name, token.split('=')[1]) )
         except IndexError:
             pass
-        sys.argv.remove(token)
-
-    if token.lower().startswith('--static'):
+    return handler
+
+# distutils appends the contents of CFLAGS and LDFLAGS from the environment to
+# the flags Python was built with, so extra options must be appended to any
+# existing value. Replacing the value would discard the user's or packager's
+# flags (and change ccache's hash of the command line).
+
+def augment_env(var, extra):
+    os.environ[var] = (os.environ.get(var, '') + ' ' + extra).strip()
+
+def enable_coverage(token):
+    global use_lto
+    # gcov needs an unoptimized build; CFLAGS is also used when linking.
+    use_lto = False
+    augment_env('CFLAGS', '--coverage -O0')
+
+option_handlers = {
+    '--force'         : add_define('FORCE'),
+    '--lib64'         : set_global('lib_path', 'lib64'),
+    '--lib32'         : set_global('lib_path', 'lib32'),
+    '--ccache'        : set_global('use_ccache', True),
+    '--no-ccache'     : set_global('use_ccache', False),
+    '--no-lto'        : set_global('use_lto', False),
+    '--pgo'           : set_global('use_pgo', True),
+    '--msys2'         : add_define('MSYS2'),
+    '--shared'        : add_dir_define('SHARED'),
+    '--static'        : add_dir_define('STATIC'),
+    '--prefer-static' : set_global('prefer_static', True),
+    '--coverage'      : enable_coverage,
+    '--native'        : set_global('use_native', True),
+    }
+
+# Make a single pass over the arguments and keep everything that isn't one of
+# our options for distutils.
+argv = sys.argv[:1]
+for token in sys.argv[1:]:
+    handler = option_handlers.get(token.lower().split('=')[0])
+    if handler:
+        handler(token)
+    else:
+        argv.append(token)
+sys.argv[:] = argv
+
+# Return the directories in search_dirs that contain the GMP, MPFR, and MPC
+# headers. If a header exists in more than one directory, the last one wins.
+
+def find_libraries(search_dirs):
+    gmp_found = ''
+    mpfr_found = ''
+    mpc_found = ''
+    for adir in search_dirs:
+        # Read each include directory once instead of testing for each header.
         try:
-            defines.append( ('STATIC', token.split('=')[1]) )
-        except IndexError:
-            pass
-        sys.argv.remove(token)
+            headers = set(os.listdir(os.path.join(adir, 'include')))
+        except OSError:
+            headers = set()
+        if 'gmp.h' in headers:
+            gmp_found = adir
+        if 'mpfr.h' in headers:
+            mpfr_found = adir
+        if 'mpc.h' in headers:
+            mpc_found = adir
+    return gmp_found, mpfr_found, mpc_found
+
+def unique(seq):
+    # Return the items of seq without duplicates, preserving their order.
+    seen = set()
+    result = []
+    for item in seq:
+        if item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
 
 # Improved clean command.
 
@@ -107,92 +211,239 @@ class gmpy_build_ext(build_ext):
 
     def initialize_options(self):
         build_ext.initialize_options(self)
-        
+
     def doit(self):
         # Find the directory specfied for non-standard library location.
         search_dirs = []
         static = False
         msys2 = False
 
+        ext = self.extensions[0]
+
         # Assume that we will always want to use the GMP, MPFR, and MPC libraries.
-        self.extensions[0].libraries.extend(['gmp', 'mpfr', 'mpc'])
-        
-        for d in self.extensions[0].define_macros[:]:
+        # They are listed before the libraries they depend on.
+        ext.libraries.extend(['mpc', 'mpfr', 'gmp'])
+
+        # Process the macros created from our command line options in a single
+        # pass. Only MSYS2 is needed by the C source; the others are dropped.
+        keep = []
+        for d in ext.define_macros:
             if d[0] == 'MSYS2':
                 self.compiler = 'mingw32'
                 msys2 = True
-
-            if d[0] == 'FORCE':
+                keep.append(d)
+            elif d[0] == 'FORCE':
                 self.force = 1
-                try:
-                    self.extensions[0].define_macros.remove(d)
-                except ValueError:
-                    pass
-                    
-            if d[0] in ('SHARED', 'STATIC'):
-                if d[0] == 'STATIC':
-                    static = True
-                if d[0] == 'SHARED':
-                    static = False
+            elif d[0] in ('SHARED', 'STATIC'):
+                static = (d[0] == 'STATIC')
                 if d[1]:
                     search_dirs.extend(map(os.path.expanduser, d[1].split(":")))
-                    try:
-                        self.extensions[0].define_macros.remove(d)
-                    except ValueError:
-                        pass
+            else:
+                keep.append(d)
+        ext.define_macros = keep
 
         # If non-default directories have been specified, we need to find the
         # exact location of the libraries to allow static or runtime linking.
         
-        gmp_found = ''
-        mpfr_found = ''
-        mpc_found = ''
+        gmp_found, mpfr_found, mpc_found = '', '', ''
         if search_dirs:
-
-            for adir in search_dirs:
-                lookin = os.path.join(adir, 'include')
-                if os.path.isfile(os.path.join(lookin, 'gmp.h')):
-                    gmp_found = adir
-                if os.path.isfile(os.path.join(lookin, 'mpfr.h')):
-                    mpfr_found = adir
-                if os.path.isfile(os.path.join(lookin, 'mpc.h')):
-                    mpc_found = adir
+            gmp_found, mpfr_found, mpc_found = find_libraries(search_dirs)
 
         # Add the directory information for location where valid versions were
         # found. This can cause confusion if there are multiple installations of
         # the same version of Python on the system.
 
-        for adir in (gmp_found, mpfr_found, mpc_found):
+        for adir in unique([gmp_found, mpfr_found, mpc_found]):
             if not adir:
                 continue
-            if os.path.join(adir, 'include') in self.extensions[0].include_dirs:
+            ext.include_dirs += [os.path.join(adir, 'include')]
+            ext.library_dirs += [os.path.join(adir, lib_path)]
+
+            # Add the runtime linking options. There is no equivalent on
+            # Windows, including MSYS2 builds.
+            if not static and not IS_WINDOWS:
+                ext.runtime_library_dirs += [os.path.join(adir, lib_path)]
+
+        # Avoid passing the same -I, -L, or -R option more than once.
+        ext.include_dirs = unique(ext.include_dirs)
+        ext.library_dirs = unique(ext.library_dirs)
+        ext.runtime_library_dirs = unique(ext.runtime_library_dirs)
+
+        # Add the static linking options. With --prefer-static, a library is
+        # linked statically only if its static version exists. A library that
+        # is linked statically is dropped from the list of shared libraries.
+        # The archives are given by full path so no -Bstatic/-Bdynamic
+        # grouping is needed, but they must have been compiled with -fPIC.
+        archives = []
+        for name, adir in (('mpc', mpc_found), ('mpfr', mpfr_found), ('gmp', gmp_found)):
+            if not adir:
                 continue
-            self.extensions[0].include_dirs += [os.path.join(adir, 'include')]
-            self.extensions[0].library_dirs += [os.path.join(adir, lib_path)]
-
-            # Add the runtime linking options.
-            if not static and not windows:
-                self.extensions[0].runtime_library_dirs += [os.path.join(adir, lib_path)]
-
-        # Add the static linking options.
-        if static and gmp_found:
-            self.extensions[0].extra_objects.append(os.path.join(gmp_found, lib_path, 'libgmp.a'))
-        if static and mpfr_found:
-            self.extensions[0].extra_objects.append(os.path.join(mpfr_found, lib_path, 'libmpfr.a'))
-        if static and mpc_found:
-            self.extensions[0].extra_objects.append(os.path.join(mpc_found, lib_path, 'libmpc.a'))
+            archive = os.path.join(adir, lib_path, 'lib%s.a' % name)
+            if static or (prefer_static and os.path.isfile(archive)):
+                archives.append(archive)
+                ext.libraries.remove(name)
+
+        # GNU ld only searches an archive once, in command line order, so the
+        # archives are wrapped in a group. This also keeps the link command
+        # the same regardless of the order in which the libraries were found.
+        if archives:
+            if IS_WINDOWS or sys.platform == 'darwin':
+                ext.extra_objects += archives
+            else:
+                ext.extra_link_args += (['-Wl,--start-group'] + archives +
+                                        ['-Wl,--end-group'])
 
         # Add MSVC specific options.
-        if windows and not msys2:
-            self.extensions[0].extra_link_args.append('/MANIFEST')
+        if IS_MSVC and not msys2:
+            ext.extra_link_args.append('/MANIFEST')
 
-    def finalize_options(self):
-        build_ext.finalize_options(self)
+    def run(self):
+        # Commands such as sdist and egg_info finalize build_ext without
+        # building anything, so the libraries are only set up here. This must
+        # happen before build_ext.run() creates the compiler so that --msys2
+        # can select mingw32.
         gmpy_build_ext.doit(self)
-        
+        build_ext.run(self)
+
+    def is_clang(self):
+        # The compiler may be run via ccache (CC="ccache clang"), and on macOS
+        # and some other systems 'cc' or 'gcc' is really clang, so check both
+        # the command and the compiler's version banner.
+        cmd = self.compiler.compiler_so
+        if sys.platform == 'darwin' or 'clang' in ' '.join(cmd):
+            return True
+        cc = [c for c in cmd if os.path.basename(c) != 'ccache'][:1]
+        try:
+            proc = subprocess.Popen(cc + ['--version'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            banner = proc.communicate()[0]
+        except OSError:
+            return False
+        return b'clang' in banner
+
+    def has_flag(self, flag):
+        # Return True if the compiler accepts flag when compiling a trivial
+        # source file.
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir, 'flagtest.c')
+            f = open(source, 'w')
+            try:
+                f.write('int main(void) { return 0; }\n')
+            finally:
+                f.close()
+            try:
+                self.compiler.compile([source], output_dir=tmpdir,
+                                      extra_postargs=[flag])
+            except CompileError:
+                return False
+            return True
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def build_extensions(self):
+        # Enable link time optimization so the compiler can inline across the
+        # many small wrapper functions in gmpy2.c.
+        if use_lto:
+            compile_args = []
+            link_args = []
+            if self.compiler.compiler_type == 'unix':
+                # Older compilers don't know these options, so each one is
+                # only used if the compiler accepts it. The optimization level
+                # is left to CFLAGS.
+                if self.has_flag('-flto'):
+                    compile_args = ['-flto']
+                    link_args = ['-flto']
+                # clang already ignores semantic interposition when inlining.
+                if (not self.is_clang() and
+                    self.has_flag('-fno-semantic-interposition')):
+                    compile_args.append('-fno-semantic-interposition')
+            elif self.compiler.compiler_type == 'msvc':
+                compile_args = ['/GL']
+                link_args = ['/LTCG']
+            for ext in self.extensions:
+                ext.extra_compile_args += compile_args
+                ext.extra_link_args += link_args
+
+        # Let the compiler use every instruction the build machine supports.
+        if use_native:
+            if self.compiler.compiler_type == 'unix':
+                writeln("warning: --native was specified; the extension will "
+                        "not be portable to other CPUs")
+                for ext in self.extensions:
+                    ext.extra_compile_args += ['-march=native', '-mtune=native']
+            else:
+                writeln("--native is only supported with gcc and clang; ignoring it.")
+
+        # Use ccache, if it is available, so that rebuilding gmpy2.c is nearly
+        # free when nothing has changed. A compiler that is already invoked
+        # via ccache (i.e. CC="ccache gcc") is left alone.
+        if use_ccache and self.compiler.compiler_type == 'unix':
+            ccache = find_executable('ccache')
+            if ccache:
+                # Allow builds in temporary directories (pip) to share the
+                # cache.
+                os.environ.setdefault('CCACHE_NOHASHDIR', 'true')
+                os.environ.setdefault('CCACHE_BASEDIR', os.getcwd())
+                for key in ('compiler', 'compiler_so', 'compiler_cxx'):
+                    cmd = getattr(self.compiler, key, None)
+                    if cmd and os.path.basename(cmd[0]) != 'ccache':
+                        self.compiler.set_executable(key, [ccache] + cmd)
+
+        if use_pgo:
+            self.build_pgo()
+        else:
+            build_ext.build_extensions(self)
+
+    def build_pgo(self):
+        # Profile guided optimization is done in two passes. First an
+        # instrumented extension is built and the doctest suite is run
+        # against it. The extension is then rebuilt using the .gcda files that
+        # were written next to the object files.
+        if self.compiler.compiler_type != 'unix' or self.is_clang():
+            writeln("--pgo is only supported with gcc; ignoring it.")
+            build_ext.build_extensions(self)
+            return
+
+        # Both passes must recompile gmpy2.c. Profiles left over from an
+        # earlier build no longer match the source and would be merged into
+        # (or read instead of) the new profile, so remove them first.
+        self.force = 1
+        for dirpath, dirnames, filenames in os.walk(self.build_temp):
+            for name in filenames:
+                if name.endswith('.gcda'):
+                    os.remove(os.path.join(dirpath, name))
+        saved = [(ext.extra_compile_args[:], ext.extra_link_args[:])
+                 for ext in self.extensions]
+
+        for ext in self.extensions:
+            ext.extra_compile_args += ['-fprofile-generate']
+            ext.extra_link_args += ['-fprofile-generate']
+        build_ext.build_extensions(self)
+
+        writeln("running the test suite to collect profile data")
+        if self.inplace:
+            build_dir = os.getcwd()
+        else:
+            build_dir = os.path.abspath(self.build_lib)
+        env = dict(os.environ)
+        if env.get('PYTHONPATH'):
+            env['PYTHONPATH'] = build_dir + os.pathsep + env['PYTHONPATH']
+        else:
+            env['PYTHONPATH'] = build_dir
+        if sys.version_info[0] == 2:
+            test_dir = 'test2'
+        else:
+            test_dir = 'test3'
+        test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), test_dir)
+        if subprocess.call([sys.executable, 'gmpy_test.py'], cwd=test_dir, env=env):
+            writeln("warning: the test run failed, the profile may be incomplete")
+
+        for ext, (compile_args, link_args) in zip(self.extensions, saved):
+            ext.extra_compile_args = compile_args + ['-fprofile-use', '-fprofile-correction']
+            ext.extra_link_args = link_args + ['-fprofile-use']
+        build_ext.build_extensions(self)
 
-# decomment next line (w/gcc, only!) to support gcov
-#   os.environ['CFLAGS'] = '-fprofile-arcs -ftest-coverage -O0'
 
 # prepare the extension for building
 
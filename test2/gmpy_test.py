@@ -20,6 +20,8 @@ import gmpy_test_mpz
 import gmpy_test_dec
 
 
+# The mpf, mpq, and mpz tests are repeated with caching disabled only if
+# the environment variable GMPY_FULL_TESTS is set.
 test_modules = (gmpy_test_cvr, gmpy_test_mpf,
     gmpy_test_mpq, gmpy_test_mpz, gmpy_test_dec)
 
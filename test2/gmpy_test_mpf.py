@@ -5,9 +5,8 @@ r'''
 ['as_integer_ratio', 'as_mantissa_exp', 'as_simple_fraction', 'conjugate', 'digits', 'imag', 'is_integer', 'precision', 'rc', 'real']
 >>>
 '''
-import sys
 
-import gmpy2 as _g, doctest, sys
+import gmpy2 as _g, doctest, sys, os, cStringIO
 __test__={}
 a=_g.mpfr('123.456')
 b=_g.mpfr('789.123')
@@ -120,13 +119,15 @@ mpfr('6.0')
 1
 >>> _g.floor(-12.3)==math.floor(-12.3)
 1
->>> _g.reldiff(a**2,float(a)**2) < 1.03 * (2.0**-(a.precision-1))
+>>> eps_a=2.0**-(a.precision-1)
+>>> eps_b=2.0**-(b.precision-1)
+>>> _g.reldiff(a**2,float(a)**2) < 1.03 * eps_a
 1
->>> _g.reldiff(a**2,a*a) < (2.0**-(a.precision-1))
+>>> _g.reldiff(a**2,a*a) < eps_a
 1
->>> _g.reldiff(b**2,float(b)**2) < 1.03 * (2.0**-(b.precision-1))
+>>> _g.reldiff(b**2,float(b)**2) < 1.03 * eps_b
 1
->>> _g.reldiff(b**2,b*b) < (2.0**-(b.precision-1))
+>>> _g.reldiff(b**2,b*b) < eps_b
 1
 >>> _g.reldiff(3.4)
 Traceback (innermost last):
@@ -138,25 +139,29 @@ mpfr('11.111075555498667')
 >>> _g.sqrt(-1.0)
 mpfr('nan')
 >>> save=_g.get_context().precision
->>> _g.const_catalan()
-mpfr('0.91596559417721901')
->>> _g.const_euler()
-mpfr('0.57721566490153287')
->>> _g.const_log2()
-mpfr('0.69314718055994529')
->>> _g.const_pi()
-mpfr('3.1415926535897931')
 >>> _g.get_context().precision = 100
->>> _g.const_catalan()
+>>> catalan=_g.const_catalan()
+>>> catalan
 mpfr('0.91596559417721901505460351493252',100)
->>> _g.const_euler()
+>>> euler=_g.const_euler()
+>>> euler
 mpfr('0.57721566490153286060651209008234',100)
->>> _g.const_log2()
+>>> log2=_g.const_log2()
+>>> log2
 mpfr('0.69314718055994530941723212145798',100)
->>> _g.const_pi()
+>>> pi=_g.const_pi()
+>>> pi
 mpfr('3.1415926535897932384626433832793',100)
 >>> _g.get_context().precision = save
 >>> del(save)
+>>> _g.round2(catalan,53)
+mpfr('0.91596559417721901')
+>>> _g.round2(euler,53)
+mpfr('0.57721566490153287')
+>>> _g.round2(log2,53)
+mpfr('0.69314718055994529')
+>>> _g.round2(pi,53)
+mpfr('3.1415926535897931')
 >>> import pickle
 >>> flt = _g.mpfr(1234.6789)
 >>> flt == pickle.loads(pickle.dumps(flt))
@@ -369,18 +374,16 @@ def _test(chat=None):
     thismod = sys.modules.get(__name__)
     doctest.testmod(thismod, report=0)
 
-    if chat: print "Repeating tests, with caching disabled"
-    _g.set_cache(0,128)
+    if os.environ.get('GMPY_FULL_TESTS'):
+        if chat: print "Repeating tests, with caching disabled"
+        _g.set_cache(0,128)
 
-    sav = sys.stdout
-    class _Dummy:
-        def write(self,*whatever):
-            pass
-    try:
-        sys.stdout = _Dummy()
-        doctest.testmod(thismod, report=0)
-    finally:
-        sys.stdout = sav
+        sav = sys.stdout
+        try:
+            sys.stdout = cStringIO.StringIO()
+            doctest.testmod(thismod, report=0)
+        finally:
+            sys.stdout = sav
 
     if chat:
         print
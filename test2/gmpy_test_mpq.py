@@ -6,7 +6,7 @@ r'''
 >>>
 '''
 
-import gmpy2 as _g, doctest,sys
+import gmpy2 as _g, doctest,sys, os, cStringIO
 __test__={}
 a=_g.mpq('123/456')
 b=_g.mpq('789/123')
@@ -281,18 +281,16 @@ def _test(chat=None):
     thismod = sys.modules.get(__name__)
     doctest.testmod(thismod, report=0)
 
-    if chat: print "Repeating tests, with caching disabled"
-    _g.set_cache(0,128)
+    if os.environ.get('GMPY_FULL_TESTS'):
+        if chat: print "Repeating tests, with caching disabled"
+        _g.set_cache(0,128)
 
-    sav = sys.stdout
-    class _Dummy:
-        def write(self,*whatever):
-            pass
-    try:
-        sys.stdout = _Dummy()
-        doctest.testmod(thismod, report=0)
-    finally:
-        sys.stdout = sav
+        sav = sys.stdout
+        try:
+            sys.stdout = cStringIO.StringIO()
+            doctest.testmod(thismod, report=0)
+        finally:
+            sys.stdout = sav
 
     if chat:
         print
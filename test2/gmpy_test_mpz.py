@@ -8,7 +8,7 @@ r'''
 >>>
 '''
 
-import gmpy2 as _g, doctest, sys, operator, gc
+import gmpy2 as _g, doctest, sys, os, cStringIO, operator, gc
 __test__={}
 a=_g.mpz(123)
 b=_g.mpz(456)
@@ -825,18 +825,16 @@ def _test(chat=None):
     thismod = sys.modules.get(__name__)
     doctest.testmod(thismod, report=0)
 
-    if chat: print "Repeating tests, with caching disabled"
-    _g.set_cache(0,128)
+    if os.environ.get('GMPY_FULL_TESTS'):
+        if chat: print "Repeating tests, with caching disabled"
+        _g.set_cache(0,128)
 
-    sav = sys.stdout
-    class _Dummy:
-        def write(self,*whatever):
-            pass
-    try:
-        sys.stdout = _Dummy()
-        doctest.testmod(thismod, report=0)
-    finally:
-        sys.stdout = sav
+        sav = sys.stdout
+        try:
+            sys.stdout = cStringIO.StringIO()
+            doctest.testmod(thismod, report=0)
+        finally:
+            sys.stdout = sav
 
     if chat:
         print
@@ -1,7 +1,7 @@
 # partial unit test for gmpy2 threaded mpz functionality
 # relies on Tim Peters' "doctest.py" test-driver
 
-import gmpy2 as _g, doctest, sys, operator, gc, Queue, threading
+import gmpy2 as _g, doctest, sys, os, cStringIO, operator, gc, Queue, threading
 
 __test__={}
 def _tf(N=2, _K=1234**5678):
@@ -79,18 +79,16 @@ def _test(chat=None):
     thismod = sys.modules.get(__name__)
     doctest.testmod(thismod, report=0)
 
-    if chat: print "Repeating tests, with caching disabled"
-    _g.set_zcache(0)
+    if os.environ.get('GMPY_FULL_TESTS'):
+        if chat: print "Repeating tests, with caching disabled"
+        _g.set_zcache(0)
 
-    sav = sys.stdout
-    class _Dummy:
-        def write(self,*whatever):
-            pass
-    try:
-        sys.stdout = _Dummy()
-        doctest.testmod(thismod, report=0)
-    finally:
-        sys.stdout = sav
+        sav = sys.stdout
+        try:
+            sys.stdout = cStringIO.StringIO()
+            doctest.testmod(thismod, report=0)
+        finally:
+            sys.stdout = sav
 
     if chat:
         print
@@ -14,6 +14,8 @@ import gmpy_test_dec
 import gmpy_test_xmpz
 
 
+# The mpf, mpq, mpz, and xmpz tests are repeated with caching disabled only if
+# the environment variable GMPY_FULL_TESTS is set.
 test_modules = (gmpy_test_cvr, gmpy_test_mpf,
     gmpy_test_mpq, gmpy_test_mpz, gmpy_test_dec, gmpy_test_xmpz)
 
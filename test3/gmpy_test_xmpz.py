@@ -1,7 +1,7 @@
 # partial unit test for gmpy2 xmpz functionality
 # relies on Tim Peters' "doctest.py" test-driver
 
-import gmpy2 as _g, doctest, sys, operator, gc
+import gmpy2 as _g, doctest, sys, os, io, operator, gc
 __test__={}
 a=_g.xmpz(123)
 b=_g.xmpz(456)
@@ -659,19 +659,16 @@ def _test(chat=None):
     thismod = sys.modules.get(__name__)
     doctest.testmod(thismod, report=0)
 
-    if chat: print("Repeating tests, with caching disabled")
-    _g.set_cache(0,128)
+    if os.environ.get('GMPY_FULL_TESTS'):
+        if chat: print("Repeating tests, with caching disabled")
+        _g.set_cache(0,128)
 
-    sav = sys.stdout
-    class _Dummy:
-        encoding = None
-        def write(self,*whatever):
-            pass
-    try:
-        sys.stdout = _Dummy()
-        doctest.testmod(thismod, report=0)
-    finally:
-        sys.stdout = sav
+        sav = sys.stdout
+        try:
+            sys.stdout = io.StringIO()
+            doctest.testmod(thismod, report=0)
+        finally:
+            sys.stdout = sav
 
     if chat:
         print()